@@ -9,6 +9,7 @@ MAX_TOTAL_WALK_DISTANCE_KM = 0.75 # Maximum total walking distance for a trip (t
 # --- Physical Constants ---
 WALKING_SPEED_KMPH = 5.0
 CYCLING_SPEED_KMPH = 15.0
+EARTH_RADIUS_KM = 6371.0
 
 # --- Path Configuration ---
 BASE_DIR = Path(__file__).parent
@@ -23,10 +24,12 @@ POI_WEIGHTS_PATH = DATA_DIR / 'poi_weights.csv'
 TIME_WEIGHTS_PATH = DATA_DIR / 'time_weights.csv'
 
 # Cached Data (can be regenerated)
-POI_DATABASE_PATH = CACHE_DIR / 'poi_database.json'
+POI_DATABASE_PATH = CACHE_DIR / 'poi_database.parquet'
 GRAPH_FILE_PATH = CACHE_DIR / 'eindhoven_bike_network.graphml'
 STATION_ROUTES_CACHE_PATH = CACHE_DIR / 'station_routes.pkl'
 STATION_ROUTES_META_PATH = CACHE_DIR / 'station_routes_meta.json'
+ORS_MATRIX_CACHE_PATH = CACHE_DIR / 'ors_matrix.sqlite'
+BASEMAP_TILE_CACHE_DIR = CACHE_DIR / 'basemap_tiles'
 
 # Generated Output
 CONSOLE_OUTPUT_PATH = GENERATED_DIR / 'console_output.txt'
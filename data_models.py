@@ -1,6 +1,6 @@
 # data_models.py
-from dataclasses import dataclass
-from typing import Tuple
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Tuple
 
 @dataclass
 class Station:
@@ -11,6 +11,9 @@ class Station:
     capacity: int
     bikes: int
     neighbourhood: str
+    # Optional callbacks notified with the station id whenever the bike count changes
+    on_bike_taken: Optional[Callable[[int], None]] = field(default=None, repr=False, compare=False)
+    on_bike_returned: Optional[Callable[[int], None]] = field(default=None, repr=False, compare=False)
 
     def has_bike(self) -> bool:
         """Checks if there is at least one bike available."""
@@ -24,6 +27,8 @@ class Station:
         """Removes a bike from the station if available. Returns True on success."""
         if self.has_bike():
             self.bikes -= 1
+            if self.on_bike_taken:
+                self.on_bike_taken(self.id)
             return True
         return False
 
@@ -31,6 +36,8 @@ class Station:
         """Adds a bike to the station if space is available. Returns True on success."""
         if self.has_space():
             self.bikes += 1
+            if self.on_bike_returned:
+                self.on_bike_returned(self.id)
             return True
         return False
 
@@ -23,15 +23,15 @@ def handle_user_trip(env: Environment, bike_system: BikeShareSystem, user: User)
         return
 
     # 2. Calculate trip segments and check constraints
-    walk_to_dist, walk_to_time = bike_system.get_walking_info(user.origin, (origin_station.x, origin_station.y))
-    walk_from_dist, walk_from_time = bike_system.get_walking_info((dest_station.x, dest_station.y), user.destination)
+    walk_to_dist, walk_to_time = bike_system.get_station_walking_info(user.origin, origin_station.id)
+    walk_from_dist, walk_from_time = bike_system.get_station_walking_info(user.destination, dest_station.id)
     
     if (walk_to_dist + walk_from_dist) > config.MAX_TOTAL_WALK_DISTANCE_KM:
         bike_system.stats["failed_trips"] += 1
         bike_system.hourly_failures[int(env.now / 60) % 24] += 1
         return
         
-    cycle_dist, cycle_time, route_geometry = bike_system.get_cycling_info(origin_station.id, dest_station.id)
+    cycle_dist, cycle_time, has_route = bike_system.get_cycling_info(origin_station.id, dest_station.id)
 
     # 3. Simulate the journey process
     journey_start_time = env.now
@@ -68,23 +68,21 @@ def handle_user_trip(env: Environment, bike_system: BikeShareSystem, user: User)
     bike_system.stats["total_cycling_distance"] += cycle_dist
     bike_system.station_usage[origin_station.id] += 1
     bike_system.station_usage[dest_station.id] += 1
-    if (origin_station.id, dest_station.id) in bike_system.route_usage:
-        bike_system.route_usage[(origin_station.id, dest_station.id)] += 1
+    if has_route:
+        bike_system.route_usage[origin_station.id, dest_station.id] += 1
 
-    bike_system.trip_log.append({
-        'user_origin': user.origin,
-        'user_destination': user.destination,
-        'origin_station': (origin_station.x, origin_station.y),
-        'dest_station': (dest_station.x, dest_station.y),
-        'route_geometry': route_geometry,
-        # Correctly use journey_start_time for hourly grouping
-        'start_time': journey_start_time,
-        # Add detailed timings for real-time animation
-        'walk_to_start_time': journey_start_time,
-        'cycle_start_time': cycle_start_time,
-        'walk_from_start_time': walk_from_start_time,
-        'trip_end_time': trip_end_time
-    })
+    bike_system.log_trip(
+        user,
+        origin_station.id,
+        dest_station.id,
+        # Trips are grouped by the hour the journey started
+        start_time=journey_start_time,
+        # Detailed timings for the real-time animation
+        cycle_start_time=cycle_start_time,
+        walk_from_start_time=walk_from_start_time,
+        trip_end_time=trip_end_time,
+        has_route=has_route,
+    )
 
 def user_generator(env: Environment, bike_system: BikeShareSystem):
     """Generates users based on a variable arrival rate throughout the simulation."""
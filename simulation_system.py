@@ -1,24 +1,29 @@
 # simulation_system.py
 
-import random
+import math
+import heapq
+import itertools
 import json
 import pickle
+from collections import Counter, deque
 import simpy
+import numpy as np
+import pandas as pd
 import osmnx as ox
 import geopandas as gpd
 import networkx as nx
+from scipy.spatial import cKDTree
 from typing import Dict, Tuple, Optional, List
 import streamlit as st
 
 import config
 from data_models import Station, User
 from utils import (
-    POIDatabase,
-    WeightManager,
-    haversine_distance,
+    load_poi_database,
+    load_weight_manager,
+    haversine_rad_cos,
     get_osmnx_graph,
-    get_random_point_in_polygon,
-    get_file_md5,
+    get_file_hash,
     OpenRouteServiceClient,
 )
 from config import (
@@ -29,8 +34,81 @@ from config import (
     STATION_ROUTES_META_PATH,
     CYCLING_SPEED_KMPH,
     WALKING_SPEED_KMPH,
+    EARTH_RADIUS_KM,
 )
 
+# Version of the station route cache layout; bump it whenever the cached route dicts change
+ROUTE_CACHE_FORMAT_VERSION = 2
+# Number of users generated at once whenever an hour's user buffer runs dry
+USER_BATCH_SIZE = 256
+# Number of nearest stations fetched per KD-tree query before widening the search
+STATION_QUERY_K = 16
+# Fields of each trip_log record, in order; the log becomes a DataFrame with these columns
+TRIP_LOG_COLUMNS = [
+    "origin_lon",
+    "origin_lat",
+    "destination_lon",
+    "destination_lat",
+    "origin_station_id",
+    "dest_station_id",
+    "start_time",
+    "cycle_start_time",
+    "walk_from_start_time",
+    "trip_end_time",
+    "has_route",
+]
+
+def _shortest_paths_from(
+    graph: nx.DiGraph, source: int, targets: List[int]
+) -> Optional[Tuple[Dict[int, float], Dict[int, List[int]]]]:
+    """Runs one Dijkstra from source, stopping once every reachable target is settled.
+
+    Only predecessors are tracked during the search; paths are rebuilt for the targets alone."""
+    if source not in graph:
+        return None
+    adjacency = graph.adj
+    remaining = set(targets)
+    lengths: Dict[int, float] = {}
+    predecessors: Dict[int, int] = {}
+    seen = {source: 0.0}
+    tie_breaker = itertools.count()
+    heap = [(0.0, next(tie_breaker), source, None)]
+    while heap and remaining:
+        length, _, node, predecessor = heapq.heappop(heap)
+        if node in lengths:
+            continue
+        lengths[node] = length
+        if predecessor is not None:
+            predecessors[node] = predecessor
+        remaining.discard(node)
+        for neighbour, edge in adjacency[node].items():
+            candidate = length + edge["length"]
+            if neighbour not in lengths and candidate < seen.get(neighbour, math.inf):
+                seen[neighbour] = candidate
+                heapq.heappush(heap, (candidate, next(tie_breaker), neighbour, node))
+
+    target_lengths, target_paths = {}, {}
+    for target in targets:
+        if target not in lengths:
+            continue
+        path = [target]
+        while path[-1] != source:
+            path.append(predecessors[path[-1]])
+        path.reverse()
+        target_lengths[target] = lengths[target]
+        target_paths[target] = path
+    return target_lengths, target_paths
+
+
+def _routing_graph(graph: nx.MultiDiGraph) -> nx.DiGraph:
+    """Collapses a street network into a DiGraph carrying only the shortest edge length."""
+    routing = nx.DiGraph()
+    routing.add_nodes_from(graph.nodes)
+    for u, v, length in graph.edges(data="length"):
+        if not routing.has_edge(u, v) or length < routing[u][v]["length"]:
+            routing.add_edge(u, v, length=length)
+    return routing
+
 
 class BikeShareSystem:
     """Manages the state and logic of the entire bike-sharing system."""
@@ -41,11 +119,14 @@ class BikeShareSystem:
         status_text = st.empty()
 
         status_text.text("Loading POI database...")
-        self.poi_db = POIDatabase()
+        self.poi_db = load_poi_database()
         progress_bar.progress(20)
 
         status_text.text("Loading weights...")
-        self.weights = WeightManager()
+        self.weights = load_weight_manager()
+        self._rng = np.random.default_rng()
+        self._user_buffers: Dict[int, deque] = {h: deque() for h in range(24)}
+        self._next_user_id = itertools.count(1)
         progress_bar.progress(40)
 
         status_text.text("Loading street network...")
@@ -54,6 +135,24 @@ class BikeShareSystem:
 
         status_text.text("Loading stations...")
         self.stations: List[Station] = self._load_stations()
+        # Station [lon, lat] pairs indexed by station id
+        self.station_lonlat = np.array(
+            [(s.x, s.y) for s in self.stations], dtype=np.float64
+        ).reshape(-1, 2)
+        # Station lon/lat in radians, converted once for the spatial index and walking distances
+        self._station_lons_rad = np.radians(self.station_lonlat[:, 0])
+        self._station_lats_rad = np.radians(self.station_lonlat[:, 1])
+        self._station_cos_lats = np.cos(self._station_lats_rad)
+        self._station_tree = self._build_station_tree()
+        # Bike counts and capacities indexed by station id, kept in sync with the
+        # Station objects by the station callbacks so finders work on whole arrays
+        self._station_bikes = np.array([s.bikes for s in self.stations], dtype=np.int64)
+        self._station_capacity = np.array(
+            [s.capacity for s in self.stations], dtype=np.int64
+        )
+        for station in self.stations:
+            station.on_bike_taken = self.on_bike_taken
+            station.on_bike_returned = self.on_bike_returned
         progress_bar.progress(80)
 
         status_text.text("Initializing route service...")
@@ -62,6 +161,8 @@ class BikeShareSystem:
 
         status_text.text("Computing station routes...")
         self.station_routes = self._precompute_or_load_station_routes()
+        self._route_distance_km, self._route_duration_min = self._build_route_arrays()
+        self._route_geometries: Dict[Tuple[int, int], object] = {}
         progress_bar.progress(100)
 
         # Simulation statistics
@@ -71,13 +172,14 @@ class BikeShareSystem:
             "total_walking_distance": 0.0,
             "total_cycling_distance": 0.0,
         }
-        self.trip_log: List[Dict] = []
+        # One tuple per successful trip, in TRIP_LOG_COLUMNS order; see trips_frame()
+        self.trip_log: List[tuple] = []
+        self._trips_frame: Optional[pd.DataFrame] = None
         self.station_state_log: List[Dict] = []
         self.station_usage: Dict[int, int] = {s.id: 0 for s in self.stations}
         self.station_failures: Dict[int, int] = {s.id: 0 for s in self.stations}
-        self.route_usage: Dict[Tuple[int, int], int] = {
-            key: 0 for key in self.station_routes
-        }
+        # Trip counts per (origin station id, destination station id)
+        self.route_usage = np.zeros((len(self.stations), len(self.stations)), dtype=np.int32)
         self.hourly_bike_counts: Dict[int, Dict[int, int]] = {}
         self.hourly_failures: Dict[int, int] = {
             h: 0 for h in range(24)
@@ -105,19 +207,60 @@ class BikeShareSystem:
             {"time": time, "station_id": station_id, "bikes": bikes}
         )
 
+    def log_trip(
+        self,
+        user: User,
+        origin_station_id: int,
+        dest_station_id: int,
+        start_time: float,
+        cycle_start_time: float,
+        walk_from_start_time: float,
+        trip_end_time: float,
+        has_route: bool,
+    ):
+        """Records a successful trip as one row of the trip log."""
+        self.trip_log.append(
+            (
+                *user.origin,
+                *user.destination,
+                origin_station_id,
+                dest_station_id,
+                start_time,
+                cycle_start_time,
+                walk_from_start_time,
+                trip_end_time,
+                has_route,
+            )
+        )
+
+    def trips_frame(self) -> pd.DataFrame:
+        """Returns the trip log as a DataFrame, converting it only when trips were added."""
+        if self._trips_frame is None or len(self._trips_frame) != len(self.trip_log):
+            self._trips_frame = pd.DataFrame.from_records(
+                self.trip_log, columns=TRIP_LOG_COLUMNS
+            )
+        return self._trips_frame
+
     def _load_stations(self) -> List[Station]:
         """Loads station data from the GeoJSON file."""
         stations_gdf = gpd.read_file(STATION_GEOJSON_PATH)
+        centroids = stations_gdf.geometry.centroid
+        if "name" in stations_gdf.columns:
+            names = stations_gdf["name"].tolist()
+        else:
+            names = [f"Station_{index}" for index in range(len(stations_gdf))]
         stations = [
             Station(
                 id=index,
-                x=row.geometry.centroid.x,
-                y=row.geometry.centroid.y,
+                x=x,
+                y=y,
                 capacity=20,  # Default capacity
                 bikes=10,  # Default starting bikes
-                neighbourhood=row.get("name", f"Station_{index}"),
+                neighbourhood=name,
+            )
+            for index, (x, y, name) in enumerate(
+                zip(centroids.x.tolist(), centroids.y.tolist(), names)
             )
-            for index, row in stations_gdf.iterrows()
         ]
         print(f"Loaded {len(stations)} stations.")
         return stations
@@ -132,8 +275,11 @@ class BikeShareSystem:
         try:
             with open(STATION_ROUTES_META_PATH, "r") as f:
                 meta_data = json.load(f)
-            current_hash = get_file_md5(STATION_GEOJSON_PATH)
-            return meta_data.get("station_file_hash") == current_hash
+            current_hash = get_file_hash(STATION_GEOJSON_PATH)
+            return (
+                meta_data.get("format_version") == ROUTE_CACHE_FORMAT_VERSION
+                and meta_data.get("station_file_hash") == current_hash
+            )
         except (json.JSONDecodeError, FileNotFoundError):
             return False
 
@@ -159,45 +305,75 @@ class BikeShareSystem:
                 "ORS client not available or failed. Using OSMnx estimates for travel times."
             )
 
-        for i, origin in enumerate(self.stations):
+        # Snap every station to its nearest graph node in a single batched query
+        station_nodes = ox.nearest_nodes(
+            self.graph,
+            X=[s.x for s in self.stations],
+            Y=[s.y for s in self.stations],
+        )
+
+        # One Dijkstra run per origin yields the shortest path to every destination
+        routing_graph = _routing_graph(self.graph)
+        targets = list(station_nodes)
+        results = (
+            _shortest_paths_from(routing_graph, source, targets)
+            for source in station_nodes
+        )
+
+        for i, (origin, result) in enumerate(zip(self.stations, results)):
+            if result is None:
+                continue
+            lengths, paths = result
+
             for j, dest in enumerate(self.stations):
                 if origin.id == dest.id:
                     continue
-                try:
-                    o_node = ox.nearest_nodes(self.graph, origin.x, origin.y)
-                    d_node = ox.nearest_nodes(self.graph, dest.x, dest.y)
-                    path_nodes = nx.shortest_path(
-                        self.graph, o_node, d_node, weight="length"
-                    )
-
-                    if not path_nodes:
-                        continue
+                d_node = station_nodes[j]
+                path_nodes = paths.get(d_node)
+                if not path_nodes:
+                    continue
 
-                    route_gdf = ox.routing.route_to_gdf(self.graph, path_nodes)
-                    distance_km = route_gdf["length"].sum() / 1000
+                distance_km = lengths[d_node] / 1000
 
-                    if ors_matrix:
-                        distance_km = ors_matrix["distances"][i][j] / 1000
-                        duration_min = ors_matrix["durations"][i][j] / 60
-                    else:
-                        duration_min = (distance_km / CYCLING_SPEED_KMPH) * 60
+                if ors_matrix:
+                    distance_km = ors_matrix["distances"][i][j] / 1000
+                    duration_min = ors_matrix["durations"][i][j] / 60
+                else:
+                    duration_min = (distance_km / CYCLING_SPEED_KMPH) * 60
 
-                    routes[(origin.id, dest.id)] = {
-                        "geometry": route_gdf.unary_union,
-                        "distance": distance_km,
-                        "duration": duration_min,
-                    }
-                except (nx.NetworkXNoPath, nx.NodeNotFound):
-                    continue
+                # Geometry is built lazily from the node path by get_route_geometry
+                routes[(origin.id, dest.id)] = {
+                    "path": path_nodes,
+                    "distance": distance_km,
+                    "duration": duration_min,
+                }
 
         print(f"Saving {len(routes)} computed routes to cache...")
         with open(STATION_ROUTES_CACHE_PATH, "wb") as f:
             pickle.dump(routes, f)
         with open(STATION_ROUTES_META_PATH, "w") as f:
-            json.dump({"station_file_hash": get_file_md5(STATION_GEOJSON_PATH)}, f)
+            json.dump(
+                {
+                    "format_version": ROUTE_CACHE_FORMAT_VERSION,
+                    "station_file_hash": get_file_hash(STATION_GEOJSON_PATH),
+                },
+                f,
+            )
 
         return routes
 
+    def _build_route_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Packs route distances (km) and durations (min) into dense (N, N) float32 arrays.
+
+        Station pairs without a route are NaN."""
+        n = len(self.stations)
+        distance_km = np.full((n, n), np.nan, dtype=np.float32)
+        duration_min = np.full((n, n), np.nan, dtype=np.float32)
+        for (origin_id, dest_id), route in self.station_routes.items():
+            distance_km[origin_id, dest_id] = route["distance"]
+            duration_min[origin_id, dest_id] = route["duration"]
+        return distance_km, duration_min
+
     def record_bike_counts_process(self, env: simpy.Environment):
         """A simpy process that records bike counts at each station every hour."""
         while True:
@@ -207,91 +383,155 @@ class BikeShareSystem:
             }
             yield env.timeout(60)  # Wait for one simulation hour
 
-    def generate_user(self, current_sim_time: float) -> Optional[User]:
-        """Generates a new user with an origin and destination based on POI weights."""
-        hour = int((current_sim_time / 60) % 24)
-        origin_type = self.weights.get_poi_type_for_hour(hour)
-        dest_type = self.weights.get_poi_type_for_hour(hour)
+    def generate_users(self, hour: int, k: int) -> List[Optional[User]]:
+        """Generates k users for a given hour in one batch based on POI weights.
 
-        try:
-            origin_poi = self.poi_db.get_random_poi(origin_type)
-            dest_poi = self.poi_db.get_random_poi(dest_type)
-        except (IndexError, KeyError):
-            # This can happen if a POI type has no entries in the database
-            return None
+        Entries are None where a sampled POI type has no entries in the database."""
+        type_pairs = self.weights.sample_poi_type_pairs(hour, k, self._rng)
+        type_counts = Counter(t for pair in type_pairs for t in pair)
 
-        origin_coords = (
-            get_random_point_in_polygon(origin_poi["geometry"])
-            if "geometry" in origin_poi
-            else (origin_poi["lon"], origin_poi["lat"])
-        )
-        dest_coords = (
-            get_random_point_in_polygon(dest_poi["geometry"])
-            if "geometry" in dest_poi
-            else (dest_poi["lon"], dest_poi["lat"])
-        )
+        locations = {}
+        for poi_type, count in type_counts.items():
+            try:
+                locations[poi_type] = iter(
+                    self.poi_db.sample_locations(poi_type, count, self._rng)
+                )
+            except (IndexError, KeyError):
+                # This can happen if a POI type has no entries in the database
+                continue
+
+        users = []
+        for origin_type, dest_type in type_pairs:
+            if origin_type not in locations or dest_type not in locations:
+                users.append(None)
+                continue
+            users.append(
+                User(
+                    id=next(self._next_user_id),
+                    origin=next(locations[origin_type]),
+                    destination=next(locations[dest_type]),
+                    origin_type=origin_type,
+                    destination_type=dest_type,
+                )
+            )
+        return users
 
-        return User(
-            id=random.randint(10000, 99999),
-            origin=origin_coords,
-            destination=dest_coords,
-            origin_type=origin_type,
-            destination_type=dest_type,
-        )
+    def generate_user(self, current_sim_time: float) -> Optional[User]:
+        """Returns the next user for the current hour from a batch-generated buffer."""
+        hour = int((current_sim_time / 60) % 24)
+        buffer = self._user_buffers[hour]
+        if not buffer:
+            buffer.extend(self.generate_users(hour, USER_BATCH_SIZE))
+        return buffer.popleft()
 
-    def get_walking_info(
-        self, start_coords: tuple, end_coords: tuple
+    def get_station_walking_info(
+        self, location: tuple, station_id: int
     ) -> Tuple[float, float]:
-        """Calculates walking distance (km) and time (minutes)."""
-        dist_km = haversine_distance(start_coords, end_coords)
+        """Calculates walking distance (km) and time (minutes) between a location and a station."""
+        lat_rad = math.radians(location[1])
+        dist_km = haversine_rad_cos(
+            math.radians(location[0]),
+            lat_rad,
+            math.cos(lat_rad),
+            self._station_lons_rad[station_id],
+            self._station_lats_rad[station_id],
+            self._station_cos_lats[station_id],
+        )
         time_min = (dist_km / WALKING_SPEED_KMPH) * 60
         return dist_km, time_min
 
     def get_cycling_info(
         self, origin_station_id: int, dest_station_id: int
-    ) -> Tuple[float, float, Optional[object]]:
-        """Retrieves pre-computed cycling distance, time, and route geometry."""
-        route = self.station_routes.get((origin_station_id, dest_station_id))
+    ) -> Tuple[float, float, bool]:
+        """Retrieves pre-computed cycling distance, time, and whether a route exists.
+
+        Route geometry is left to get_route_geometry, so the simulation does no shapely work."""
+        duration_min = self._route_duration_min[origin_station_id, dest_station_id]
+        if np.isnan(duration_min):
+            return 0, 0, False
         return (
-            (route["distance"], route["duration"], route["geometry"])
-            if route
-            else (0, 0, None)
+            float(self._route_distance_km[origin_station_id, dest_station_id]),
+            float(duration_min),
+            True,
         )
 
-    def find_nearest_station_with_bike(self, location: tuple) -> Optional[Station]:
-        """Finds the closest station to a location that has at least one bike."""
-        available_stations = [s for s in self.stations if s.has_bike()]
-        if not available_stations:
+    def get_route_geometry(
+        self, origin_station_id: int, dest_station_id: int
+    ) -> Optional[object]:
+        """Returns the cycling route geometry, building it once on first use."""
+        key = (origin_station_id, dest_station_id)
+        geometry = self._route_geometries.get(key)
+        if geometry is not None:
+            return geometry
+
+        route = self.station_routes.get(key)
+        if not route:
+            return None
+        route_gdf = ox.routing.route_to_gdf(self.graph, route["path"])
+        geometry = route_gdf.union_all()
+        self._route_geometries[key] = geometry
+        return geometry
+
+    def on_bike_taken(self, station_id: int):
+        """Mirrors a bike being taken from a station in the bike count array."""
+        self._station_bikes[station_id] -= 1
+
+    def on_bike_returned(self, station_id: int):
+        """Mirrors a bike being returned to a station in the bike count array."""
+        self._station_bikes[station_id] += 1
+
+    def _build_station_tree(self) -> cKDTree:
+        """Builds a KD-tree over station coordinates on a local equirectangular projection."""
+        mean_lat = float(np.mean(self._station_lats_rad)) if self.stations else 0.0
+        self._projection_kx = EARTH_RADIUS_KM * math.cos(mean_lat)
+        return cKDTree(
+            np.c_[
+                self._station_lons_rad * self._projection_kx,
+                self._station_lats_rad * EARTH_RADIUS_KM,
+            ]
+        )
+
+    def _nearest_station(
+        self, location: tuple, candidates: np.ndarray
+    ) -> Optional[Station]:
+        """Returns the station closest to a (lon, lat) location among the masked stations.
+
+        Queries the k nearest stations and widens k until one of them is a candidate."""
+        if not candidates.any():
             for station in self.stations:
-                if not station.has_bike():
-                    self.station_failures[station.id] += 1
+                self.station_failures[station.id] += 1
             return None
-        return min(
-            available_stations, key=lambda s: haversine_distance(location, (s.x, s.y))
+        point = (
+            math.radians(location[0]) * self._projection_kx,
+            math.radians(location[1]) * EARTH_RADIUS_KM,
         )
+        n_stations = len(self.stations)
+        k = min(STATION_QUERY_K, n_stations)
+        while True:
+            _, idxs = self._station_tree.query(point, k=k)
+            idxs = np.atleast_1d(idxs)
+            hits = idxs[candidates[idxs]]
+            if hits.size:
+                return self.stations[hits[0]]
+            k = min(k * 2, n_stations)
+
+    def find_nearest_station_with_bike(self, location: tuple) -> Optional[Station]:
+        """Finds the closest station to a location that has at least one bike."""
+        return self._nearest_station(location, self._station_bikes > 0)
 
     def find_nearest_station_with_space(self, location: tuple) -> Optional[Station]:
         """Finds the closest station to a location that has at least one empty dock."""
-        available_stations = [s for s in self.stations if s.has_space()]
-        if not available_stations:
-            for station in self.stations:
-                if not station.has_space():
-                    self.station_failures[station.id] += 1
-            return None
-        return min(
-            available_stations, key=lambda s: haversine_distance(location, (s.x, s.y))
+        return self._nearest_station(
+            location, self._station_bikes < self._station_capacity
         )
 
     def get_stations_needing_rebalancing(
         self, min_threshold: float = 0.3, max_threshold: float = 0.7
     ) -> List[Station]:
         """Returns stations that need rebalancing based on fill ratio thresholds."""
-        return [
-            station
-            for station in self.stations
-            if (station.bikes / station.capacity) < min_threshold
-            or (station.bikes / station.capacity) > max_threshold
-        ]
+        fill_ratio = self._station_bikes / self._station_capacity
+        needs_rebalancing = (fill_ratio < min_threshold) | (fill_ratio > max_threshold)
+        return [self.stations[i] for i in np.flatnonzero(needs_rebalancing)]
 
     def generate_rebalancing_route(
         self, min_threshold: float = 0.3, max_threshold: float = 0.7
@@ -1,69 +1,209 @@
 # utils.py
 import math
 import json
-import random
+import time
+import pickle
+import sqlite3
 import hashlib
+import itertools
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import osmnx as ox
+import networkx as nx
 import geopandas as gpd
-from shapely.geometry import Polygon, Point, mapping
+import shapely
+from shapely.geometry import Polygon
 from typing import List, Tuple, Optional, Dict
 from pathlib import Path
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 import os
 import streamlit as st
 
+try:
+    from numba import njit
+except ImportError:
+    print("Warning: 'numba' library not installed. Falling back to pure Python kernels.")
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit that returns the function unchanged."""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 from config import (
     NEIGHBORHOOD_AREAS_GEOJSON_PATH, POI_WEIGHTS_PATH, TIME_WEIGHTS_PATH,
-    POI_DATABASE_PATH, CACHE_DIR
+    POI_DATABASE_PATH, CACHE_DIR, ORS_MATRIX_CACHE_PATH, EARTH_RADIUS_KM
 )
 
+# Number of concurrent Overpass requests when generating the POI database; the public
+# Overpass servers grant two request slots per client, so more only earns 429 responses
+POI_FETCH_WORKERS = 2
+# Attempts per area query before its POIs are skipped, and the first retry delay in seconds
+POI_FETCH_ATTEMPTS = 4
+POI_FETCH_BACKOFF_S = 5.0
+# Largest number of sources (and of destinations) sent in one ORS matrix request
+ORS_MATRIX_BLOCK_SIZE = 50
+
 ox.utils.settings.use_cache = True
 ox.utils.settings.cache_folder = str(CACHE_DIR / 'osmnx')
 ox.utils.settings.log_console = False
+# Let osmnx wait for a free Overpass slot before each query
+ox.utils.settings.overpass_rate_limit = True
 
-def get_file_md5(filepath: Path) -> str:
-    """Calculates the MD5 hash of a file to check for changes."""
-    hash_md5 = hashlib.md5()
+def get_file_hash(filepath: Path) -> str:
+    """Calculates the BLAKE2b hash of a file to check for changes."""
     try:
         with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+            return hashlib.file_digest(f, "blake2b").hexdigest()
     except FileNotFoundError:
         return ""
 
+@st.cache_resource
+def _read_neighborhood_areas(file_hash: str) -> gpd.GeoDataFrame:
+    """Reads the neighbourhood areas GeoJSON through a GeoParquet copy cached per file hash."""
+    cache_path = CACHE_DIR / f"areas_{file_hash}.parquet"
+    if file_hash and cache_path.exists():
+        return gpd.read_parquet(cache_path)
+    # Only the area name is used downstream, so skip decoding the other attributes
+    areas_gdf = gpd.read_file(NEIGHBORHOOD_AREAS_GEOJSON_PATH, engine="pyogrio", columns=["buurtnaam"])
+    if file_hash:
+        cache_path.parent.mkdir(exist_ok=True, parents=True)
+        areas_gdf.to_parquet(cache_path)
+        # Copies made for earlier versions of the GeoJSON will never be read again
+        for stale_path in cache_path.parent.glob("areas_*.parquet"):
+            if stale_path != cache_path:
+                stale_path.unlink(missing_ok=True)
+    return areas_gdf
+
+def read_neighborhood_areas() -> gpd.GeoDataFrame:
+    """Returns the neighbourhood areas, shared in memory until the GeoJSON is edited."""
+    return _read_neighborhood_areas(get_file_hash(NEIGHBORHOOD_AREAS_GEOJSON_PATH))
+
+def _graph_pickle_key(graph_filepath: Path) -> Tuple[str, str, str]:
+    """Returns what a graph pickle depends on: the GraphML contents and the library versions."""
+    return (get_file_hash(graph_filepath), nx.__version__, ox.__version__)
+
+@st.cache_resource
 def get_osmnx_graph(city_query: str, graph_filepath: Path):
-    """Loads a street network graph from a local file or downloads it if not present."""
+    """Loads a street network graph from a local file or downloads it if not present.
+
+    The GraphML file is the portable copy; a pickle next to it is used for fast reloads
+    while it matches the GraphML file and the installed networkx and osmnx versions."""
+    pickle_filepath = graph_filepath.with_suffix('.pkl')
+    if pickle_filepath.exists() and graph_filepath.exists():
+        try:
+            with open(pickle_filepath, 'rb') as f:
+                key, graph = pickle.load(f)
+            if key == _graph_pickle_key(graph_filepath):
+                print(f"Loading graph from {pickle_filepath}")
+                return graph
+        except Exception as e:
+            print(f"Warning: Could not read graph pickle {pickle_filepath}: {e}")
+
     if graph_filepath.exists():
         print(f"Loading graph from {graph_filepath}")
-        return ox.load_graphml(filepath=str(graph_filepath))
-    
-    print(f"Graph file not found. Downloading network for '{city_query}'...")
-    graph = ox.graph_from_place(city_query, network_type='bike')
-    graph_filepath.parent.mkdir(parents=True, exist_ok=True)
-    ox.save_graphml(graph, filepath=str(graph_filepath))
-    print(f"Saved graph to {graph_filepath}")
+        graph = ox.load_graphml(filepath=str(graph_filepath))
+    else:
+        print(f"Graph file not found. Downloading network for '{city_query}'...")
+        graph = ox.graph_from_place(city_query, network_type='bike')
+        graph_filepath.parent.mkdir(parents=True, exist_ok=True)
+        ox.save_graphml(graph, filepath=str(graph_filepath))
+        print(f"Saved graph to {graph_filepath}")
+
+    with open(pickle_filepath, 'wb') as f:
+        pickle.dump((_graph_pickle_key(graph_filepath), graph), f, protocol=5)
     return graph
 
 def haversine_distance(p1: tuple, p2: tuple) -> float:
     """Calculates the great-circle distance between two (lon, lat) points in kilometers."""
-    lon1, lat1, lon2, lat2 = map(math.radians, [p1[0], p1[1], p2[0], p2[1]])
+    return haversine_rad(
+        math.radians(p1[0]), math.radians(p1[1]), math.radians(p2[0]), math.radians(p2[1])
+    )
+
+@njit(cache=True, fastmath=True)
+def haversine_rad_cos(lon1: float, lat1: float, cos_lat1: float, lon2: float, lat2: float, cos_lat2: float) -> float:
+    """Great-circle distance in kilometers between two points in radians, given their latitude cosines."""
     dlon, dlat = lon2 - lon1, lat2 - lat1
-    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-    return 6371 * (2 * math.asin(math.sqrt(a)))
+    a = math.sin(dlat / 2)**2 + cos_lat1 * cos_lat2 * math.sin(dlon / 2)**2
+    return EARTH_RADIUS_KM * (2 * math.asin(math.sqrt(a)))
+
+@njit(cache=True, fastmath=True)
+def haversine_rad(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """Great-circle distance in kilometers between two points given in radians."""
+    return haversine_rad_cos(lon1, lat1, math.cos(lat1), lon2, lat2, math.cos(lat2))
+
+# Compile (or load from cache) at import so the first simulated trip does not pay for it
+haversine_rad(0.0, 0.0, 0.0, 0.0)
+
+# Triangulations of sampled polygons, keyed by id() and holding the polygon to pin it
+_polygon_triangulations: Dict[int, Tuple[Polygon, np.ndarray, np.ndarray]] = {}
+
+def _triangulate_polygon(polygon: Polygon) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns a polygon's (T, 3, 2) triangle vertices and cumulative triangle areas, cached."""
+    cached = _polygon_triangulations.get(id(polygon))
+    if cached is not None and cached[0] is polygon:
+        return cached[1], cached[2]
+    triangles = shapely.get_parts(shapely.constrained_delaunay_triangles(polygon))
+    vertices = shapely.get_coordinates(triangles).reshape(-1, 4, 2)[:, :3]
+    cum_areas = np.cumsum(shapely.area(triangles))
+    _polygon_triangulations[id(polygon)] = (polygon, vertices, cum_areas)
+    return vertices, cum_areas
+
+def _poi_columns(poi_list: List[Dict]) -> Dict:
+    """Converts a list of POI dicts into parallel columns.
 
-def get_random_point_in_polygon(polygon: Polygon) -> tuple:
-    """Generates a random point safely within the bounds of a Polygon."""
-    min_x, min_y, max_x, max_y = polygon.bounds
-    while True:
-        point = Point(random.uniform(min_x, max_x), random.uniform(min_y, max_y))
-        if polygon.contains(point):
-            return (point.x, point.y)
+    Point POIs carry lon/lat and no geometry; area POIs carry a name and geometry with NaN lon/lat."""
+    return {
+        'lon': np.array([poi.get('lon', np.nan) for poi in poi_list], dtype=np.float64),
+        'lat': np.array([poi.get('lat', np.nan) for poi in poi_list], dtype=np.float64),
+        'name': [poi.get('name') for poi in poi_list],
+        'geometry': [poi.get('geometry') for poi in poi_list],
+    }
+
+def get_random_points_in_polygon(polygon: Polygon, k: int, rng: np.random.Generator) -> np.ndarray:
+    """Generates k uniformly random points inside a Polygon as a (k, 2) array of (x, y)."""
+    vertices, cum_areas = _triangulate_polygon(polygon)
+    picks = np.searchsorted(cum_areas, rng.random(k) * cum_areas[-1], side='right')
+    triangles = vertices[np.minimum(picks, len(cum_areas) - 1)]
+    r = rng.random((k, 2))
+    flip = r.sum(axis=1) > 1
+    r[flip] = 1 - r[flip]
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    return a + r[:, :1] * (b - a) + r[:, 1:] * (c - a)
+
+def _merge_tags(tag_sets) -> Dict:
+    """Unions several OSM tag filters into one, as accepted by ox.features_from_polygon."""
+    merged = {}
+    for tags in tag_sets:
+        for key, value in tags.items():
+            if value is True or merged.get(key) is True:
+                merged[key] = True
+            else:
+                values = merged.setdefault(key, [])
+                values.extend(v for v in (value if isinstance(value, list) else [value]) if v not in values)
+    return merged
+
+def _matches_tags(features_gdf: gpd.GeoDataFrame, tags: Dict) -> pd.Series:
+    """Returns a mask of the features matching any of an OSM tag filter's key/value pairs."""
+    mask = pd.Series(False, index=features_gdf.index)
+    for key, value in tags.items():
+        if key not in features_gdf.columns:
+            continue
+        column = features_gdf[key]
+        if value is True:
+            mask |= column.notna()
+        else:
+            mask |= column.isin(value if isinstance(value, list) else [value])
+    return mask
 
 class POIDatabase:
     """Manages fetching, caching, and accessing Points of Interest (POIs)."""
     def __init__(self):
-        self.poi_data: Dict[str, List[Dict]] = {}
+        # POI type -> columns {'lon', 'lat', 'name', 'geometry'}, see _poi_columns
+        self.poi_data: Dict[str, Dict] = {}
         if POI_DATABASE_PATH.exists():
             print("Loading existing POI database...")
             self._load_from_file()
@@ -74,7 +214,7 @@ class POIDatabase:
     def _generate_from_osm(self):
         """Fetches POIs from OSM based on predefined tags and neighborhood areas."""
         try:
-            areas_gdf = gpd.read_file(NEIGHBORHOOD_AREAS_GEOJSON_PATH)
+            areas_gdf = read_neighborhood_areas()
         except Exception as e:
             raise SystemExit(f"Error reading GeoJSON '{NEIGHBORHOOD_AREAS_GEOJSON_PATH}': {e}")
         
@@ -86,68 +226,127 @@ class POIDatabase:
             'restaurant': {'amenity': 'restaurant'}, 'park': {'leisure': ['park', 'playground', 'garden']},
             'sport': {'leisure': ['sports_centre', 'pitch', 'stadium'], 'sport': True}
         }
-        self.poi_data = {key: [] for key in list(poi_tags.keys()) + list(special_areas.keys())}
+        poi_lists = {key: [] for key in list(poi_tags.keys()) + list(special_areas.keys())}
 
-        for _, area_row in areas_gdf.iterrows():
-            area_name, geometry = area_row['buurtnaam'], area_row['geometry']
+        fetch_tasks = []
+        for area_name, geometry in zip(areas_gdf['buurtnaam'].tolist(), areas_gdf.geometry.tolist()):
             
             is_special = any(
-                self.poi_data[key].append({'name': area_name, 'geometry': geometry}) or True
+                poi_lists[key].append({'name': area_name, 'geometry': geometry}) or True
                 for key, name_val in special_areas.items() if area_name == name_val
             )
             
             if not is_special:
-                self._fetch_pois_for_geometry(geometry, poi_tags)
+                fetch_tasks.append(geometry)
+
+        # One Overpass query per area covers every POI type; the queries are network-bound,
+        # so run them concurrently and collect in order
+        with ThreadPoolExecutor(max_workers=POI_FETCH_WORKERS) as executor:
+            results = executor.map(lambda geometry: self._fetch_pois(geometry, poi_tags), fetch_tasks)
+            for area_pois in results:
+                for poi_type, pois in area_pois.items():
+                    poi_lists[poi_type].extend(pois)
         
+        self.poi_data = {key: _poi_columns(poi_list) for key, poi_list in poi_lists.items()}
         self._save_to_file()
         self._print_summary()
 
-    def _fetch_pois_for_geometry(self, geometry: Polygon, poi_tags: Dict):
-        """Fetches POIs for a given polygon geometry and appends them to the database."""
-        for poi_type, tags in poi_tags.items():
+    def _fetch_pois(self, geometry: Polygon, poi_tags: Dict) -> Dict[str, List[Dict]]:
+        """Fetches POIs of all types within a polygon geometry using a single query.
+
+        Failed queries are retried with exponential backoff, so a rate-limited or
+        overloaded Overpass server does not drop the area's POIs."""
+        for attempt in range(POI_FETCH_ATTEMPTS):
             try:
-                pois_gdf = ox.features_from_polygon(geometry, tags)
-                if poi_type == 'home' and len(pois_gdf) > 200:
-                    pois_gdf = pois_gdf.sample(n=200, random_state=42)
-                
-                for _, poi_row in pois_gdf.iterrows():
-                    centroid = poi_row.geometry.centroid
-                    self.poi_data[poi_type].append({'lat': centroid.y, 'lon': centroid.x})
-            except Exception:
-                continue
+                features_gdf = ox.features_from_polygon(geometry, _merge_tags(poi_tags.values()))
+                break
+            except ox._errors.InsufficientResponseError:
+                # The area has no matching features
+                return {}
+            except Exception as e:
+                if attempt == POI_FETCH_ATTEMPTS - 1:
+                    print(f"Warning: Could not fetch POIs for an area: {e}")
+                    return {}
+                time.sleep(POI_FETCH_BACKOFF_S * 2**attempt)
+
+        area_pois = {}
+        for poi_type, tags in poi_tags.items():
+            pois_gdf = features_gdf[_matches_tags(features_gdf, tags)]
+            if poi_type == 'home' and len(pois_gdf) > 200:
+                pois_gdf = pois_gdf.sample(n=200, random_state=42)
+            
+            centroids = pois_gdf.geometry.centroid
+            area_pois[poi_type] = [
+                {'lat': lat, 'lon': lon}
+                for lon, lat in zip(centroids.x.tolist(), centroids.y.tolist())
+            ]
+        return area_pois
 
     def _load_from_file(self):
-        """Loads the POI database from a JSON file."""
-        with open(POI_DATABASE_PATH, 'r') as f:
-            raw_data = json.load(f)
-        for key, poi_list in raw_data.items():
-            self.poi_data[key] = []
-            for poi_dict in poi_list:
-                if 'geometry' in poi_dict and poi_dict['geometry']:
-                    poi_dict['geometry'] = Polygon(poi_dict['geometry']['coordinates'][0])
-                self.poi_data[key].append(poi_dict)
+        """Loads the POI database from a Parquet file."""
+        table = pq.read_table(POI_DATABASE_PATH)
+        types = table.column('type').to_numpy(zero_copy_only=False)
+        lons = table.column('lon').to_numpy(zero_copy_only=False)
+        lats = table.column('lat').to_numpy(zero_copy_only=False)
+        names = table.column('name').to_pylist()
+        # Decode every area geometry from WKB in one vectorized call; point POIs stay None
+        geometries = shapely.from_wkb(np.array(table.column('geometry').to_pylist(), dtype=object))
+        self.poi_data = {}
+        for key in json.loads(table.schema.metadata[b'poi_types']):
+            rows = np.flatnonzero(types == key)
+            self.poi_data[key] = {
+                'lon': lons[rows].astype(np.float64),
+                'lat': lats[rows].astype(np.float64),
+                'name': [names[i] for i in rows],
+                'geometry': geometries[rows].tolist(),
+            }
 
     def _save_to_file(self):
-        """Saves the POI database to a JSON file, serializing Shapely objects."""
+        """Saves the POI database to a Parquet file, storing area geometries as WKB."""
         POI_DATABASE_PATH.parent.mkdir(exist_ok=True, parents=True)
-        serializable_data = {}
-        for key, poi_list in self.poi_data.items():
-            serializable_data[key] = [
-                {**poi, 'geometry': mapping(poi['geometry'])} if 'geometry' in poi else poi
-                for poi in poi_list
-            ]
-        with open(POI_DATABASE_PATH, 'w') as f:
-            json.dump(serializable_data, f, indent=2)
+        schema = pa.schema(
+            [('type', pa.string()), ('lon', pa.float64()), ('lat', pa.float64()),
+             ('name', pa.string()), ('geometry', pa.binary())],
+            # Keep types without any POIs so they survive a round trip
+            metadata={'poi_types': json.dumps(list(self.poi_data))},
+        )
+        pois = self.poi_data.values()
+        table = pa.table({
+            'type': [key for key, cols in self.poi_data.items() for _ in cols['name']],
+            'lon': np.concatenate([cols['lon'] for cols in pois] or [[]]),
+            'lat': np.concatenate([cols['lat'] for cols in pois] or [[]]),
+            'name': [name for cols in pois for name in cols['name']],
+            'geometry': shapely.to_wkb(
+                np.array([geom for cols in pois for geom in cols['geometry']], dtype=object)
+            ).tolist(),
+        }, schema=schema)
+        pq.write_table(table, POI_DATABASE_PATH, compression='zstd')
 
     def _print_summary(self):
         print("\n--- POI Database Generation Summary ---")
         for key, value in sorted(self.poi_data.items()):
-            print(f"  -> Found {len(value):>5} POIs for type: '{key}'")
+            print(f"  -> Found {len(value['lon']):>5} POIs for type: '{key}'")
         print("---------------------------------------\n")
 
-    def get_random_poi(self, poi_type: str) -> Dict:
-        """Returns a random POI of a given type."""
-        return random.choice(self.poi_data[poi_type.strip()])
+    def sample_locations(self, poi_type: str, k: int, rng: np.random.Generator) -> List[Tuple[float, float]]:
+        """Returns k random (lon, lat) locations of a given type, drawn with replacement.
+
+        Area POIs contribute a random point inside their geometry. Raises KeyError for an
+        unknown type and IndexError for a type without POIs."""
+        pois = self.poi_data[poi_type.strip()]
+        if not len(pois['lon']):
+            raise IndexError(f"No POIs of type '{poi_type}'")
+        picks = rng.integers(len(pois['lon']), size=k)
+        lons, lats = pois['lon'][picks], pois['lat'][picks]
+        locations = list(zip(lons.tolist(), lats.tolist()))
+        # Draw the points for each picked area POI in one batch
+        area_rows = np.flatnonzero(np.isnan(lons))
+        for poi_index in np.unique(picks[area_rows]):
+            rows = area_rows[picks[area_rows] == poi_index]
+            points = get_random_points_in_polygon(pois['geometry'][poi_index], len(rows), rng)
+            for row, xy in zip(rows.tolist(), points.tolist()):
+                locations[row] = tuple(xy)
+        return locations
 
 class WeightManager:
     """Loads and provides access to trip generation weights."""
@@ -159,20 +358,57 @@ class WeightManager:
             print("Successfully loaded POI and time weights.")
         except FileNotFoundError as e:
             raise SystemExit(f"Error: Weight file not found. {e}")
+        self._hour_pairs = {hour: self._build_type_pairs(hour) for hour in range(24)}
+        self._arrival_rates = self._build_arrival_rates()
 
-    def get_poi_type_for_hour(self, hour: int) -> str:
-        """Returns a POI type based on weighted probabilities for a given hour."""
+    def _hour_type_weights(self, hour: int) -> Tuple[List[str], List[float]]:
+        """Returns the POI types and their weights for an hour, uniform if the hour has none."""
+        types = list(self.poi_weights.index)
         weights = self.poi_weights.get(str(hour))
         if weights is None or weights.sum() == 0:
-            return random.choice(self.poi_weights.index)
-        return random.choices(weights.index, weights=weights.values, k=1)[0]
+            return types, [1.0] * len(types)
+        return types, weights.tolist()
+
+    def _build_type_pairs(self, hour: int) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        """Builds all (origin, destination) POI type pairs and their cumulative joint weights."""
+        types, type_weights = self._hour_type_weights(hour)
+        pairs = list(itertools.product(types, types))
+        cum_weights = np.cumsum(np.outer(type_weights, type_weights).ravel())
+        return pairs, cum_weights
+
+    def sample_poi_type_pairs(self, hour: int, k: int, rng: np.random.Generator) -> List[Tuple[str, str]]:
+        """Returns k (origin, destination) POI type pairs sampled for a given hour."""
+        pairs, cum_weights = self._hour_pairs[hour]
+        picks = np.searchsorted(cum_weights, rng.random(k) * cum_weights[-1], side='right')
+        return [pairs[i] for i in np.minimum(picks, len(pairs) - 1)]
     
+    def _build_arrival_rates(self) -> List[float]:
+        """Returns the user arrival rate (users per minute) for each hour of the day."""
+        rates = []
+        for hour in range(24):
+            try:
+                rates.append(float(self.time_weights.loc[f"hour_{hour}", 'estimated_trips']) / 60.0)
+            except KeyError:
+                rates.append(0.0)
+        return rates
+
     def get_arrival_rate_for_hour(self, hour: int) -> float:
         """Returns the user arrival rate (users per minute) for a given hour."""
-        try:
-            return self.time_weights.loc[f"hour_{hour}", 'estimated_trips'] / 60.0
-        except KeyError:
-            return 0.0
+        return self._arrival_rates[hour]
+
+@st.cache_resource
+def load_poi_database() -> POIDatabase:
+    """Returns a POIDatabase shared by every session in this process."""
+    return POIDatabase()
+
+@st.cache_resource
+def _load_weight_manager(poi_weights_hash: str, time_weights_hash: str) -> WeightManager:
+    """Returns a WeightManager cached per version of the two weight files."""
+    return WeightManager()
+
+def load_weight_manager() -> WeightManager:
+    """Returns a shared WeightManager, reloaded when the weight files are edited."""
+    return _load_weight_manager(get_file_hash(POI_WEIGHTS_PATH), get_file_hash(TIME_WEIGHTS_PATH))
 
 class OpenRouteServiceClient:
     """Client for the OpenRouteService API."""
@@ -189,14 +425,59 @@ class OpenRouteServiceClient:
                 print(f"Warning: Could not initialize ORS client: {e}")
 
     def get_matrix(self, locations: List[Tuple[float, float]]) -> Optional[Dict]:
-        """Gets a time and distance matrix between locations for cycling."""
+        """Gets a time and distance matrix between locations for cycling.
+
+        Pairs already in the on-disk cache are not requested again; the rest are fetched in
+        blocks of at most ORS_MATRIX_BLOCK_SIZE origins by destinations."""
         if not self.client:
             return None
+        n = len(locations)
+        keys = [f"{lon:.6f},{lat:.6f}" for lon, lat in locations]
+        durations = [[None] * n for _ in range(n)]
+        distances = [[None] * n for _ in range(n)]
+
+        ORS_MATRIX_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(ORS_MATRIX_CACHE_PATH)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ors_matrix ("
+                "origin TEXT, destination TEXT, duration REAL, distance REAL, "
+                "PRIMARY KEY (origin, destination))"
+            )
+            cached = {
+                (origin, destination): (duration, distance)
+                for origin, destination, duration, distance
+                in conn.execute("SELECT origin, destination, duration, distance FROM ors_matrix")
+            }
+            blocks = [range(start, min(start + ORS_MATRIX_BLOCK_SIZE, n)) for start in range(0, n, ORS_MATRIX_BLOCK_SIZE)]
+            for sources in blocks:
+                for destinations in blocks:
+                    pairs = [(i, j) for i in sources for j in destinations]
+                    if all((keys[i], keys[j]) in cached for i, j in pairs):
+                        for i, j in pairs:
+                            durations[i][j], distances[i][j] = cached[(keys[i], keys[j])]
+                        continue
+                    block = self._request_matrix(locations, sources, destinations)
+                    if block is None:
+                        return None
+                    rows = []
+                    for bi, i in enumerate(sources):
+                        for bj, j in enumerate(destinations):
+                            durations[i][j] = block["durations"][bi][bj]
+                            distances[i][j] = block["distances"][bi][bj]
+                            rows.append((keys[i], keys[j], durations[i][j], distances[i][j]))
+                    conn.executemany("INSERT OR REPLACE INTO ors_matrix VALUES (?, ?, ?, ?)", rows)
+        return {"durations": durations, "distances": distances}
+
+    def _request_matrix(self, locations: List[Tuple[float, float]], sources: range, destinations: range) -> Optional[Dict]:
+        """Requests the matrix between a block of source and destination locations."""
         try:
-            coords = [[lon, lat] for lon, lat in locations]
+            coords = [[locations[i][0], locations[i][1]] for i in list(sources) + list(destinations)]
             return self.client.distance_matrix(
-                locations=coords, metrics=['duration', 'distance'], profile='cycling-regular'
+                locations=coords,
+                sources=list(range(len(sources))),
+                destinations=list(range(len(sources), len(sources) + len(destinations))),
+                metrics=['duration', 'distance'], profile='cycling-regular'
             )
         except Exception as e:
             print(f"Error fetching ORS matrix: {e}")
-            return None
\ No newline at end of file
+            return None
@@ -3,21 +3,38 @@
 import folium
 import folium.plugins
 import geopandas as gpd
+import shapely
 import numpy as np
+import matplotlib
+# Figures are only written to files, so no GUI backend is needed
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
-import contextily as cx
-from shapely.geometry import Point, LineString, MultiLineString, mapping
+from shapely.geometry import LineString, MultiLineString, mapping
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from data_models import Station
 from openrouteservice import convert
 import pandas as pd
 import math
+import weakref
 
 import config
 from simulation_system import BikeShareSystem
+from utils import read_neighborhood_areas
 
 BASE_DATE = datetime(2025, 1, 1)
+# Web Mercator geometries per system, reused across plot calls; dropped with the system
+_projected_geometries: "weakref.WeakKeyDictionary[BikeShareSystem, Dict]" = weakref.WeakKeyDictionary()
+# POI types with more points than this are clustered in the browser instead of drawn individually
+POI_CLUSTER_THRESHOLD = 5000
+# Douglas-Peucker tolerance in degrees (about 1 m) applied to routes before they are written to HTML
+ROUTE_SIMPLIFY_TOLERANCE = 1e-5
+# zlib level for PNG exports; level 1 encodes several times faster than the default for a slightly larger file
+PNG_COMPRESS_LEVEL = 1
+# Simplification tolerance in degrees (about 5 m) for area POI outlines on the POI map
+POI_AREA_SIMPLIFY_TOLERANCE = 5e-5
+# Simplified route GeoJSON geometries and coordinate counts per system, keyed by route (o, d)
+_route_geojson: "weakref.WeakKeyDictionary[BikeShareSystem, Dict]" = weakref.WeakKeyDictionary()
 
 def get_station_color(bikes: int, capacity: int) -> str:
     """Determines a hex color for a station marker based on bike availability percentage."""
@@ -35,6 +52,15 @@ def get_station_color(bikes: int, capacity: int) -> str:
     else:
         return '#5cb85c'  # Green: Normal
 
+def get_station_colors(bikes: np.ndarray, capacities: np.ndarray) -> np.ndarray:
+    """Vectorized get_station_color over arrays of bike counts and capacities."""
+    fill_ratios = np.divide(bikes, capacities, out=np.zeros(len(bikes)), where=capacities > 0)
+    return np.select(
+        [capacities == 0, bikes == 0, bikes == capacities, fill_ratios <= 0.3, fill_ratios >= 0.8],
+        ['#808080', '#d9534f', '#0275d8', '#f0ad4e', '#5bc0de'],
+        default='#5cb85c'
+    )
+
 def calculate_bearing(p1: tuple, p2: tuple) -> float:
     """Calculates the bearing (angle) between two (lon, lat) points."""
     lon1, lat1 = math.radians(p1[0]), math.radians(p1[1])
@@ -74,7 +100,7 @@ def create_poi_distribution_map(system: BikeShareSystem):
     """Generates a Folium map showing all POI types and neighborhood boundaries."""
     if not system.stations: return
     map_center = [system.stations[0].y, system.stations[0].x]
-    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron")
+    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron", prefer_canvas=True)
 
     colors = {
         'home': 'blue', 'shops': 'red', 'edu': 'green', 'uni': 'purple',
@@ -83,38 +109,57 @@ def create_poi_distribution_map(system: BikeShareSystem):
     }
 
     # Add POIs
-    for poi_type, poi_list in sorted(system.poi_db.poi_data.items()):
-        if not poi_list: continue
+    for poi_type, pois in sorted(system.poi_db.poi_data.items()):
+        if not len(pois['lon']): continue
         fg = folium.FeatureGroup(name=poi_type.capitalize(), show=True).add_to(m)
         color = colors.get(poi_type, 'gray')
         
-        for poi in poi_list:
-            if 'geometry' in poi:
-                # For area POIs (like neighborhoods, campuses)
-                folium.GeoJson(
-                    poi['geometry'],
-                    style_function=lambda _, c=color: {
-                        'fillColor': c,
-                        'color': c,
-                        'fillOpacity': 0.3,
-                        'weight': 2
-                    },
-                    tooltip=poi.get('name', poi_type)
-                ).add_to(fg)
-            else:
-                # For point POIs
-                folium.CircleMarker(
-                    location=[poi['lat'], poi['lon']],
-                    radius=3,
-                    color=color,
-                    fill=True,
-                    fill_opacity=0.7,
-                    tooltip=poi_type
-                ).add_to(fg)
+        # Area POIs (like neighborhoods, campuses) are added as a single layer per type
+        areas = [(name, geometry) for name, geometry in zip(pois['name'], pois['geometry']) if geometry is not None]
+        area_geometries = shapely.simplify(
+            np.array([geometry for _, geometry in areas], dtype=object), POI_AREA_SIMPLIFY_TOLERANCE
+        )
+        area_features = [
+            {'type': 'Feature', 'geometry': mapping(geometry), 'properties': {'name': name or poi_type}}
+            for (name, _), geometry in zip(areas, area_geometries)
+        ]
+        if area_features:
+            folium.GeoJson(
+                {'type': 'FeatureCollection', 'features': area_features},
+                style_function=lambda _, c=color: {
+                    'fillColor': c,
+                    'color': c,
+                    'fillOpacity': 0.3,
+                    'weight': 2
+                },
+                tooltip=folium.GeoJsonTooltip(fields=['name'], labels=False)
+            ).add_to(fg)
+
+        # Point POIs are added as a single layer per type instead of one marker each
+        is_point = ~np.isnan(pois['lon'])
+        lons, lats = pois['lon'][is_point].tolist(), pois['lat'][is_point].tolist()
+        if len(lons) > POI_CLUSTER_THRESHOLD:
+            folium.plugins.FastMarkerCluster(
+                list(zip(lats, lons)),
+                callback=(f"function (row) {{ return L.circleMarker(new L.LatLng(row[0], row[1]), "
+                          f"{{color: '{color}', fillColor: '{color}', fillOpacity: 0.7, radius: 3}}); }}")
+            ).add_to(fg)
+        elif lons:
+            folium.GeoJson(
+                {'type': 'FeatureCollection', 'features': [
+                    {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]}, 'properties': {}}
+                    for lon, lat in zip(lons, lats)
+                ]},
+                marker=folium.CircleMarker(radius=3, fill=True),
+                style_function=lambda _, c=color: {'color': c, 'fillColor': c, 'fillOpacity': 0.7},
+                tooltip=poi_type
+            ).add_to(fg)
 
     # Add neighborhood boundaries
     try:
-        boundaries_gdf = gpd.read_file(config.NEIGHBORHOOD_AREAS_GEOJSON_PATH)
+        boundaries_gdf = read_neighborhood_areas()
+        # Simplified on a copy; the loaded areas are shared with the POI database
+        boundaries_gdf = boundaries_gdf.set_geometry(boundaries_gdf.geometry.simplify(POI_AREA_SIMPLIFY_TOLERANCE))
         boundary_layer = folium.FeatureGroup(name='Neighborhood Boundaries', show=True).add_to(m)
         folium.GeoJson(
             boundaries_gdf,
@@ -140,83 +185,69 @@ def create_poi_distribution_map(system: BikeShareSystem):
 
 def create_hourly_trip_animation_map(system: BikeShareSystem):
     """Generates a Folium map animating trips, grouped by the hour they started."""
-    if not system.trip_log: return
+    trips = system.trips_frame()
+    if trips.empty: return
     map_center = [system.stations[0].y, system.stations[0].x]
-    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron")
+    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron", prefer_canvas=True)
+
+    # Trips are animated per start hour, so there are only 24 distinct timestamps
+    hour_timestamps = [(BASE_DATE + timedelta(hours=hour + 1)).isoformat() for hour in range(24)]
+    start_hours = ((trips['start_time'].to_numpy() / 60) % 24).astype(int)
+    station_lonlat = system.station_lonlat
+    walk_style = {'color': 'blue', 'weight': 2, 'opacity': 0.8, 'dashArray': '5, 5'}
+    cycle_style = {'color': 'red', 'weight': 4, 'opacity': 0.7}
 
+    # Trips sharing a start hour and the same leg are drawn once, with the trip count in the popup
     features = []
-    for trip in system.trip_log:
-        start_time_minutes = trip['start_time']
-        start_hour = int((start_time_minutes / 60) % 24)
-        timestamp = BASE_DATE + timedelta(minutes=(start_hour + 1) * 60)
-        timestamp_str = timestamp.isoformat()
-        
-        # Add walking paths
-        features.append({
-            'type': 'Feature',
-            'geometry': mapping(LineString([trip['user_origin'], trip['origin_station']])),
-            'properties': {
-                'times': [timestamp_str] * 2,
-                'style': {'color': 'blue', 'weight': 2, 'opacity': 0.8, 'dashArray': '5, 5'}
-            }
-        })
-        features.append({
-            'type': 'Feature',
-            'geometry': mapping(LineString([trip['dest_station'], trip['user_destination']])),
-            'properties': {
-                'times': [timestamp_str] * 2,
-                'style': {'color': 'blue', 'weight': 2, 'opacity': 0.8, 'dashArray': '5, 5'}
-            }
-        })
-        
-        # Add cycling path
-        cycle_geom = trip.get('route_geometry')
-        if cycle_geom and isinstance(cycle_geom, (LineString, MultiLineString)):
-            all_coords = []
-            if isinstance(cycle_geom, LineString):
-                all_coords.extend(list(cycle_geom.coords))
-            elif isinstance(cycle_geom, MultiLineString):
-                for line in cycle_geom.geoms:
-                    all_coords.extend(list(line.coords))
-            
-            if all_coords:
+    # Add walking paths
+    walk_legs = [
+        (trips[['origin_lon', 'origin_lat', 'origin_station_id']], False),
+        (trips[['destination_lon', 'destination_lat', 'dest_station_id']], True),
+    ]
+    for leg_columns, from_station in walk_legs:
+        legs, counts = np.unique(
+            np.column_stack([start_hours, leg_columns.to_numpy(dtype=np.float64)]),
+            axis=0, return_counts=True
+        )
+        for (start_hour, lon, lat, station_id), count in zip(legs.tolist(), counts.tolist()):
+            coordinates = [[lon, lat], station_lonlat[int(station_id)].tolist()]
+            if from_station: coordinates.reverse()
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': coordinates},
+                'properties': {
+                    'times': [hour_timestamps[int(start_hour)]] * 2, 'style': walk_style,
+                    'popup': f"{count} trip{'s' if count > 1 else ''}"
+                }
+            })
+
+    # Add cycling paths; routes are deterministic per station pair
+    has_route = trips['has_route'].to_numpy(dtype=bool)
+    if has_route.any():
+        legs, counts = np.unique(
+            np.column_stack([
+                start_hours[has_route],
+                trips['origin_station_id'].to_numpy()[has_route],
+                trips['dest_station_id'].to_numpy()[has_route],
+            ]),
+            axis=0, return_counts=True
+        )
+        route_keys = list(zip(legs[:, 1].tolist(), legs[:, 2].tolist()))
+        for start_hour, (geometry, num_coords), count in zip(
+            legs[:, 0].tolist(), _route_geojson_geometries(system, route_keys), counts.tolist()
+        ):
+            if num_coords:
                 features.append({
                     'type': 'Feature',
-                    'geometry': mapping(cycle_geom),
+                    'geometry': geometry,
                     'properties': {
-                        'times': [timestamp_str] * len(all_coords),
-                        'style': {'color': 'red', 'weight': 4, 'opacity': 0.7}
+                        'times': [hour_timestamps[start_hour]] * num_coords, 'style': cycle_style,
+                        'popup': f"{count} trip{'s' if count > 1 else ''}"
                     }
                 })
 
     # Add station markers for each hour
-    for hour in sorted(system.hourly_bike_counts.keys()):
-        timestamp = BASE_DATE + timedelta(hours=hour)
-        timestamp_str = timestamp.isoformat()
-        
-        for station_id, bike_count in system.hourly_bike_counts[hour].items():
-            station = next((s for s in system.stations if s.id == station_id), None)
-            if not station: continue
-            
-            features.append({
-                'type': 'Feature',
-                'geometry': {'type': 'Point', 'coordinates': [station.x, station.y]},
-                'properties': {
-                    'times': [timestamp_str],
-                    'icon': 'circle',
-                    'iconstyle': {
-                        'fillColor': get_station_color(bike_count, station.capacity),
-                        'fillOpacity': 0.9,
-                        'stroke': 'true',
-                        'radius': 8,
-                        'color': 'black',
-                        'weight': 1
-                    },
-                    'popup': (f"<b>{station.neighbourhood}</b><br>"
-                             f"Time: {timestamp.strftime('%H:%M')}<br>"
-                             f"Bikes: {bike_count} / {station.capacity}")
-                }
-            })
+    features.extend(_hourly_station_features(system))
 
     folium.plugins.TimestampedGeoJson(
         {'type': 'FeatureCollection', 'features': features},
@@ -234,9 +265,10 @@ def create_hourly_trip_animation_map(system: BikeShareSystem):
 
 def create_realtime_trip_animation_map(system: BikeShareSystem):
     """Generates a Folium map with a real-time animation of each trip."""
-    if not system.trip_log and not system.station_state_log: return
+    trips = system.trips_frame()
+    if trips.empty and not system.station_state_log: return
     map_center = [system.stations[0].y, system.stations[0].x]
-    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron")
+    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron", prefer_canvas=True)
 
     features = []
 
@@ -248,31 +280,25 @@ def create_realtime_trip_animation_map(system: BikeShareSystem):
         '#000075', '#a9a9a9'
     ]
 
-    for i, trip in enumerate(system.trip_log):
+    route_keys = list(zip(trips['origin_station_id'].tolist(), trips['dest_station_id'].tolist()))
+    trip_timings = zip(
+        _route_geojson_geometries(system, route_keys), trips['has_route'],
+        trips['cycle_start_time'], trips['walk_from_start_time']
+    )
+    base_time = np.datetime64(BASE_DATE, 'ms')
+    for i, ((geometry, num_points), has_route, cycle_start_time, walk_from_start_time) in enumerate(trip_timings):
         trip_color = trip_colors[i % len(trip_colors)]
-        try:
-            cycle_start = BASE_DATE + timedelta(minutes=trip['cycle_start_time'])
-            walk_from_start = BASE_DATE + timedelta(minutes=trip['walk_from_start_time'])
-        except KeyError:
-            continue
-
-        # Cycling segment
-        cycle_geom = trip.get('route_geometry')
-        if cycle_geom and isinstance(cycle_geom, (LineString, MultiLineString)):
-            coords = list(cycle_geom.geoms) if isinstance(cycle_geom, MultiLineString) else [cycle_geom]
-            full_coords = [c for line in coords for c in line.coords]
+
+        # Cycling segment, with its points spread evenly over the cycling time
+        if has_route and num_points:
+            point_minutes = np.linspace(cycle_start_time, max(walk_from_start_time, cycle_start_time), num_points)
+            timestamps = np.datetime_as_string(
+                base_time + (point_minutes * 60_000).astype('timedelta64[ms]'), unit='s'
+            ).tolist()
             
-            if full_coords:
-                num_points = len(full_coords)
-                duration_sec = (walk_from_start - cycle_start).total_seconds()
-                timestamps = [cycle_start.isoformat()] * num_points
-                if num_points > 1 and duration_sec > 0:
-                    time_per_pt = duration_sec / (num_points - 1)
-                    timestamps = [(cycle_start + timedelta(seconds=i * time_per_pt)).isoformat() for i in range(num_points)]
-                
-                features.append({
-                    'type': 'Feature', 'geometry': mapping(cycle_geom),
-                    'properties': { 'times': timestamps, 'style': {'color': trip_color, 'weight': 4, 'opacity': 0.7}}})
+            features.append({
+                'type': 'Feature', 'geometry': geometry,
+                'properties': { 'times': timestamps, 'style': {'color': trip_color, 'weight': 4, 'opacity': 0.7}}})
 
     # --- 2. Live Station Markers ---
     station_dict = {s.id: s for s in system.stations}
@@ -326,120 +352,227 @@ def create_station_availability_animation_map(system: BikeShareSystem):
     """Generates a TimestampedGeoJson map showing bike availability at each station per hour."""
     if not system.hourly_bike_counts: return
     map_center = [system.stations[0].y, system.stations[0].x]
-    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron")
+    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron", prefer_canvas=True)
     
+    features = _hourly_station_features(system)
+    if not features: return
+
+    folium.plugins.TimestampedGeoJson(
+        {'type': 'FeatureCollection', 'features': features}, period='PT1H', add_last_point=False,
+        auto_play=False, loop=False, max_speed=1.5, loop_button=True, time_slider_drag_update=True, duration='PT1H'
+    ).add_to(m)
+    
+    m.get_root().html.add_child(folium.Element(STATION_LEGEND_HTML))
+    m.save(str(config.STATION_AVAILABILITY_ANIMATION_PATH))
+
+def _station_marker_layer(stations: List[Station], colors: List[str], tooltips: List[str],
+                          fill_opacity: float) -> folium.GeoJson:
+    """Builds one GeoJson layer of circle station markers sharing a single marker template."""
+    features = [
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [s.x, s.y]},
+         'properties': {'color': color, 'tooltip': tooltip}}
+        for s, color, tooltip in zip(stations, colors, tooltips)
+    ]
+    return folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        marker=folium.CircleMarker(radius=8, weight=1, fill=True, fill_opacity=fill_opacity),
+        style_function=lambda x: {'color': 'black', 'fillColor': x['properties']['color']},
+        tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False)
+    )
+
+def _hourly_station_features(system: BikeShareSystem) -> List[Dict]:
+    """Builds one timestamped circle marker feature per station for every recorded hour."""
     features, station_dict = [], {s.id: s for s in system.stations}
+    capacities = np.array([s.capacity for s in system.stations], dtype=np.int64)
+    # The station name part of each popup is the same every hour
+    popup_prefixes = {s.id: f"<b>{s.neighbourhood}</b><br>" for s in system.stations}
     for hour in sorted(system.hourly_bike_counts.keys()):
         timestamp = BASE_DATE + timedelta(hours=hour)
-        for station_id, bike_count in system.hourly_bike_counts[hour].items():
-            station = station_dict.get(station_id)
-            if not station: continue
+        timestamp_str = timestamp.isoformat()
+        time_label = f"Time: {timestamp.strftime('%H:%M')}<br>"
+        bike_counts = {
+            station_id: bike_count for station_id, bike_count in system.hourly_bike_counts[hour].items()
+            if station_id in station_dict
+        }
+        colors = get_station_colors(
+            np.fromiter(bike_counts.values(), dtype=np.int64, count=len(bike_counts)),
+            capacities[np.fromiter(bike_counts.keys(), dtype=np.int64, count=len(bike_counts))]
+        )
+        for (station_id, bike_count), color in zip(bike_counts.items(), colors.tolist()):
+            station = station_dict[station_id]
             features.append({
                 'type': 'Feature',
                 'geometry': {'type': 'Point', 'coordinates': [station.x, station.y]},
                 'properties': {
-                    'time': timestamp.isoformat(), 'icon': 'circle',
+                    'times': [timestamp_str], 'icon': 'circle',
                     'iconstyle': {
-                        'fillColor': get_station_color(bike_count, station.capacity),
+                        'fillColor': color,
                         'fillOpacity': 0.9, 'stroke': 'true', 'radius': 8, 'color': 'black', 'weight': 1
                     },
-                    'popup': (f"<b>{station.neighbourhood}</b><br>"
-                              f"Time: {timestamp.strftime('%H:%M')}<br>"
-                              f"Bikes: {bike_count} / {station.capacity}")
+                    'popup': f"{popup_prefixes[station_id]}{time_label}Bikes: {bike_count} / {station.capacity}"
                 }
             })
-    if not features: return
-
-    folium.plugins.TimestampedGeoJson(
-        {'type': 'FeatureCollection', 'features': features}, period='PT1H', add_last_point=False,
-        auto_play=False, loop=False, max_speed=1.5, loop_button=True, time_slider_drag_update=True, duration='PT1H'
-    ).add_to(m)
-    
-    m.get_root().html.add_child(folium.Element(STATION_LEGEND_HTML))
-    m.save(str(config.STATION_AVAILABILITY_ANIMATION_PATH))
+    return features
 
 def create_all_trip_paths_map(system: BikeShareSystem):
     """Generates a map showing all trip paths and the FINAL state of each station."""
-    if not system.trip_log and not system.stations: return
+    trips = system.trips_frame()
+    if trips.empty and not system.stations: return
     map_center = [system.stations[0].y, system.stations[0].x]
-    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron")
+    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron", prefer_canvas=True)
 
     # Add station markers showing final availability state
     station_fg = folium.FeatureGroup(name="Stations (Final State)", show=True).add_to(m)
-    for station in system.stations:
-        color = get_station_color(station.bikes, station.capacity)
-        tooltip = f"<b>{station.neighbourhood}</b><br>Final State: {station.bikes}/{station.capacity} bikes"
-        folium.CircleMarker(
-            location=[station.y, station.x],
-            radius=8,
-            color='black',
-            weight=1,
-            fill=True,
-            fill_color=color,
-            fill_opacity=0.9,
-            tooltip=tooltip
-        ).add_to(station_fg)
+    final_colors = get_station_colors(
+        np.array([s.bikes for s in system.stations], dtype=np.int64),
+        np.array([s.capacity for s in system.stations], dtype=np.int64)
+    )
+    _station_marker_layer(
+        system.stations, final_colors.tolist(),
+        [f"<b>{s.neighbourhood}</b><br>Final State: {s.bikes}/{s.capacity} bikes" for s in system.stations],
+        fill_opacity=0.9
+    ).add_to(station_fg)
 
     # Add paths if any trips occurred
-    if system.trip_log:
+    if not trips.empty:
         walk_paths = folium.FeatureGroup(name="Walking Paths", show=False).add_to(m)
         bike_paths = folium.FeatureGroup(name="Cycling Paths", show=True).add_to(m)
-        for trip in system.trip_log:
-            folium.PolyLine([(p[1], p[0]) for p in [trip['user_origin'], trip['origin_station']]], 
-                          color='blue', weight=1.5, opacity=0.3, dash_array='5').add_to(walk_paths)
-            folium.PolyLine([(p[1], p[0]) for p in [trip['dest_station'], trip['user_destination']]], 
-                          color='blue', weight=1.5, opacity=0.3, dash_array='5').add_to(walk_paths)
-            if trip.get('route_geometry'):
-                folium.GeoJson(trip['route_geometry'], 
-                             style_function=lambda x: {'color': 'red', 'weight': 2, 'opacity': 0.2}).add_to(bike_paths)
+
+        # Both walking legs of every trip as (N, 2, 2) arrays of [lon, lat] endpoints
+        station_lonlat = system.station_lonlat
+        to_station = np.stack([
+            trips[['origin_lon', 'origin_lat']].to_numpy(dtype=np.float64),
+            station_lonlat[trips['origin_station_id'].to_numpy()],
+        ], axis=1)
+        from_station = np.stack([
+            station_lonlat[trips['dest_station_id'].to_numpy()],
+            trips[['destination_lon', 'destination_lat']].to_numpy(dtype=np.float64),
+        ], axis=1)
+        walk_features = [
+            {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'LineString', 'coordinates': coordinates}}
+            for coordinates in np.concatenate([to_station, from_station]).tolist()
+        ]
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': walk_features},
+            style_function=lambda x: {'color': 'blue', 'weight': 1.5, 'opacity': 0.3, 'dashArray': '5'}
+        ).add_to(walk_paths)
+
+        # Each cycled route is drawn once, as opaque as that many stacked lines at opacity 0.2
+        origin_ids, dest_ids = np.nonzero(system.route_usage)
+        usages = system.route_usage[origin_ids, dest_ids]
+        route_keys = list(zip(origin_ids.tolist(), dest_ids.tolist()))
+        cycle_features = [
+            {'type': 'Feature', 'geometry': geometry,
+             'properties': {'opacity': round(1 - 0.8 ** usage, 3), 'popup': f"{usage} trip{'s' if usage > 1 else ''}"}}
+            for (geometry, num_coords), usage in zip(_route_geojson_geometries(system, route_keys), usages.tolist())
+            if num_coords
+        ]
+        if cycle_features:
+            folium.GeoJson(
+                {'type': 'FeatureCollection', 'features': cycle_features},
+                style_function=lambda x: {'color': 'red', 'weight': 2, 'opacity': x['properties']['opacity']},
+                tooltip=folium.GeoJsonTooltip(fields=['popup'], labels=False)
+            ).add_to(bike_paths)
             
     m.get_root().html.add_child(folium.Element(STATION_LEGEND_HTML))
     folium.LayerControl().add_to(m)
     m.save(str(config.ALL_TRIP_PATHS_MAP_PATH))
 
 
+def _route_geojson_geometries(system: BikeShareSystem, route_keys: List[tuple]) -> List[tuple]:
+    """Returns (GeoJSON geometry, coordinate count) of each simplified route, converting routes not seen before.
+
+    Routes without a line geometry map to (None, 0)."""
+    cache = _route_geojson.setdefault(system, {})
+    missing = [key for key in dict.fromkeys(route_keys) if key not in cache]
+    if missing:
+        geometries = shapely.simplify(
+            np.array([system.get_route_geometry(*key) for key in missing], dtype=object),
+            ROUTE_SIMPLIFY_TOLERANCE, preserve_topology=False
+        )
+        for key, geometry in zip(missing, geometries):
+            if isinstance(geometry, (LineString, MultiLineString)) and not geometry.is_empty:
+                cache[key] = (mapping(geometry), int(shapely.get_num_coordinates(geometry)))
+            else:
+                cache[key] = (None, 0)
+    return [cache[key] for key in route_keys]
+
+def _web_mercator_geometries(system: BikeShareSystem) -> Dict:
+    """Returns the system's cache of Web Mercator geometries, keyed by 'stations' or route (o, d)."""
+    return _projected_geometries.setdefault(system, {})
+
+def _web_mercator_stations(system: BikeShareSystem) -> gpd.GeoSeries:
+    """Returns station points in Web Mercator, reprojecting them once per system."""
+    cache = _web_mercator_geometries(system)
+    if 'stations' not in cache:
+        cache['stations'] = gpd.GeoSeries(
+            gpd.points_from_xy(system.station_lonlat[:, 0], system.station_lonlat[:, 1]), crs="EPSG:4326"
+        ).to_crs(epsg=3857)
+    return cache['stations']
+
+def _web_mercator_routes(system: BikeShareSystem, route_keys: List[tuple]) -> List:
+    """Returns simplified route geometries in Web Mercator, reprojecting only routes not seen before."""
+    cache = _web_mercator_geometries(system)
+    missing = [key for key in route_keys if key not in cache]
+    if missing:
+        # Vertices closer than the tolerance are well below a pixel in the heatmap image
+        projected = gpd.GeoSeries(
+            shapely.simplify(
+                np.array([system.get_route_geometry(*key) for key in missing], dtype=object),
+                ROUTE_SIMPLIFY_TOLERANCE, preserve_topology=False
+            ),
+            crs="EPSG:4326"
+        ).to_crs(epsg=3857)
+        cache.update(zip(missing, projected))
+    return [cache[key] for key in route_keys]
+
 def create_results_heatmap(system: BikeShareSystem):
     """Generates a heatmap image of route and station usage."""
-    route_geometries = [
-        geom for route, usage in system.route_usage.items()
-        if usage > 0 and (geom := system.station_routes.get(route, {}).get('geometry'))
-        for _ in range(usage)
-    ]
-    if not route_geometries: return
-
-    routes_gdf = gpd.GeoDataFrame(geometry=route_geometries, crs="EPSG:4326")
+    origin_ids, dest_ids = np.nonzero(system.route_usage)
+    route_keys = list(zip(origin_ids.tolist(), dest_ids.tolist()))
+    routes_gdf = gpd.GeoDataFrame(
+        {'usage': system.route_usage[origin_ids, dest_ids]},
+        geometry=_web_mercator_routes(system, route_keys), crs="EPSG:3857"
+    ).dropna(subset=['geometry'])
+    if routes_gdf.empty: return
     stations_gdf = gpd.GeoDataFrame(
-        data=[(system.station_usage.get(s.id, 0),) for s in system.stations],
-        geometry=[Point(s.x, s.y) for s in system.stations],
-        columns=['usage'], crs="EPSG:4326"
+        {'usage': np.fromiter((system.station_usage.get(s.id, 0) for s in system.stations),
+                              dtype=np.int64, count=len(system.stations))},
+        geometry=_web_mercator_stations(system).values, crs="EPSG:3857"
     )
 
-    fig, ax = plt.subplots(figsize=(12, 12))
-    routes_gdf.to_crs(epsg=3857).plot(ax=ax, color='crimson', linewidth=0.5, alpha=0.15)
-    markersize = stations_gdf['usage'].apply(lambda x: max(x * 4, 10))
-    stations_gdf.to_crs(epsg=3857).plot(ax=ax, marker='o', color='skyblue', edgecolor='black', markersize=markersize, alpha=0.9)
+    # Only this figure needs basemap tiles, so contextily is not imported with the module
+    import contextily as cx
 
+    fig, ax = plt.subplots(figsize=(12, 12))
+    # Opacity of a route drawn once per trip at alpha 0.15, without drawing it that many times
+    route_alpha = 1 - (1 - 0.15) ** routes_gdf['usage'].to_numpy()
+    routes_gdf.plot(ax=ax, color='crimson', linewidth=0.5, alpha=route_alpha, rasterized=True)
+    markersize = np.maximum(stations_gdf['usage'].to_numpy() * 4, 10)
+    stations_gdf.plot(ax=ax, marker='o', color='skyblue', edgecolor='black', markersize=markersize, alpha=0.9)
+
+    # Keep downloaded tiles on disk so later runs render the basemap without refetching
+    config.BASEMAP_TILE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cx.set_cache_dir(str(config.BASEMAP_TILE_CACHE_DIR))
     cx.add_basemap(ax, source=cx.providers.CartoDB.Positron)
     ax.set_axis_off()
-    plt.savefig(str(config.RESULTS_HEATMAP_PATH), dpi=200, bbox_inches='tight', pad_inches=0.1)
+    plt.savefig(str(config.RESULTS_HEATMAP_PATH), dpi=200, bbox_inches='tight', pad_inches=0.1,
+                pil_kwargs={'compress_level': PNG_COMPRESS_LEVEL})
     plt.close(fig)
 
 def create_hourly_station_heatmap(system: BikeShareSystem):
     """Generates a heatmap image showing station trip activity by hour."""
-    if not system.trip_log: return
+    trips = system.trips_frame()
+    if trips.empty: return
     
     station_map = {s.id: s.neighbourhood for s in system.stations}
     station_ids = list(station_map.keys())
-    hourly_usage = {s_id: [0] * 24 for s_id in station_ids}
-    
-    for trip in system.trip_log:
-        hour = int(trip['start_time'] / 60) % 24
-        origin = next((s for s in system.stations if (s.x, s.y) == trip['origin_station']), None)
-        dest = next((s for s in system.stations if (s.x, s.y) == trip['dest_station']), None)
-        if origin: hourly_usage[origin.id][hour] += 1
-        if dest: hourly_usage[dest.id][hour] += 1
-
-    data = np.array([hourly_usage[s_id] for s_id in station_ids])
+    hours = ((trips['start_time'].to_numpy() / 60) % 24).astype(int)
+    station_hour_usage = np.zeros((len(system.stations), 24), dtype=np.int64)
+    np.add.at(station_hour_usage, (trips['origin_station_id'].to_numpy(), hours), 1)
+    np.add.at(station_hour_usage, (trips['dest_station_id'].to_numpy(), hours), 1)
+
+    data = station_hour_usage[station_ids]
     if data.sum() == 0: return
 
     fig, ax = plt.subplots(figsize=(16, max(8, len(station_map) * 0.4)))
@@ -457,7 +590,8 @@ def create_hourly_station_heatmap(system: BikeShareSystem):
     ax.set_title("Station Activity by Hour of Day")
 
     plt.tight_layout()
-    plt.savefig(str(config.HOURLY_STATION_HEATMAP_PATH), dpi=150, bbox_inches='tight')
+    plt.savefig(str(config.HOURLY_STATION_HEATMAP_PATH), dpi=150, bbox_inches='tight',
+                pil_kwargs={'compress_level': PNG_COMPRESS_LEVEL})
     plt.close(fig)
 
 def create_hourly_failures_plot(system: BikeShareSystem):
@@ -476,7 +610,8 @@ def create_hourly_failures_plot(system: BikeShareSystem):
     ax.set_xticklabels([f"{h:02d}:00" for h in hours], rotation=45)
     
     plt.tight_layout()
-    plt.savefig(str(config.HOURLY_FAILURES_PATH), dpi=150, bbox_inches='tight')
+    plt.savefig(str(config.HOURLY_FAILURES_PATH), dpi=150, bbox_inches='tight',
+                pil_kwargs={'compress_level': PNG_COMPRESS_LEVEL})
     plt.close(fig)
 
 def get_hourly_failures_data(system: BikeShareSystem) -> tuple[list, list]:
@@ -501,25 +636,19 @@ def create_rebalancing_route_map(system: BikeShareSystem, min_threshold: float =
         return None
 
     map_center = [system.stations[0].y, system.stations[0].x]
-    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron")
+    m = folium.Map(location=map_center, zoom_start=13, tiles="CartoDB positron", prefer_canvas=True)
 
     # Get stations that need rebalancing
     stations_to_visit = {s.id: s for s in rebalancing_data['stations']}
 
     # Add all stations (non-rebalancing stations in gray)
-    for station in system.stations:
-        if station.id in stations_to_visit:
-            continue  # Skip stations that need rebalancing, we'll add them with numbered markers
-        tooltip = f"<b>{station.neighbourhood}</b><br>Bikes: {station.bikes}/{station.capacity}"
-        folium.CircleMarker(
-            location=[station.y, station.x],
-            radius=8,
-            color='black',
-            weight=1,
-            fill=True,
-            fill_color='gray',
-            fill_opacity=0.5,
-            tooltip=tooltip
+    # Stations that need rebalancing are skipped, we'll add them with numbered markers
+    other_stations = [s for s in system.stations if s.id not in stations_to_visit]
+    if other_stations:
+        _station_marker_layer(
+            other_stations, ['gray'] * len(other_stations),
+            [f"<b>{s.neighbourhood}</b><br>Bikes: {s.bikes}/{s.capacity}" for s in other_stations],
+            fill_opacity=0.5
         ).add_to(m)
 
     # Add rebalancing route
@@ -543,7 +672,7 @@ def create_rebalancing_route_map(system: BikeShareSystem, min_threshold: float =
         for step in route['routes'][0]['steps']:
             if step['type'] == 'job':
                 count += 1
-                station = next((s for s in rebalancing_data['stations'] if s.id == step['id']), None)
+                station = stations_to_visit.get(step['id'])
                 if station:
                     visit_order.append({
                         'Order': count,
@@ -584,4 +713,4 @@ def create_rebalancing_route_map(system: BikeShareSystem, min_threshold: float =
     # Save to a temporary file
     output_path = config.GENERATED_DIR / 'rebalancing_route.html'
     m.save(str(output_path))
-    return str(output_path), visit_order
\ No newline at end of file
+    return str(output_path), visit_order